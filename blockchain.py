@@ -1,8 +1,40 @@
-import requests
-from datetime import datetime
+import asyncio
+import importlib.util
+import httpx
+import orjson
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from tenacity import retry, retry_if_exception_type, retry_if_result, stop_after_attempt, wait_exponential
 import pandas as pd
 import numpy as np
 
+# Rate limiting and transient server errors worth retrying with backoff
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Shared session for all HTTP calls; extract_data.py reuses it for the bitinfocharts.com
+# pages. It keeps connections alive, retries with backoff (mounted below) and caches
+# successful responses on disk. Expiry is ours rather than the server's (cache_control off),
+# so blockchain.info balances and transactions are reused for exactly 5 minutes and pages
+# for an hour. Expired entries with an ETag or Last-Modified are revalidated with a
+# conditional GET; error responses are never cached.
+SESSION = requests_cache.CachedSession(
+    'bitinfocharts_cache',
+    backend='sqlite',
+    expire_after=3600,
+    urls_expire_after={'blockchain.info': 300},
+    cache_control=False,
+)
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=_RETRY_STATUSES, respect_retry_after_header=True),
+))
+
+# (connect, read) timeouts in seconds
+_TIMEOUT = (3, 10)
+
+
 def get_bitcoin_balance(address):
     """
     Fetches the balance of a Bitcoin address using the Blockchain.com API.
@@ -11,24 +43,166 @@ def get_bitcoin_balance(address):
     address (str): The Bitcoin address to check.
 
     Returns:
-    float: The balance of the Bitcoin address in BTC.
+    int: The balance of the Bitcoin address in satoshis (divide by 1e8 for BTC).
     """
     try:
         # Make an API request to Blockchain.com to get address balance
         url = f"https://blockchain.info/q/addressbalance/{address}"
-        response = requests.get(url)
+        response = SESSION.get(url, timeout=_TIMEOUT)
         
         # Check if the request was successful
         if response.status_code == 200:
             # The API returns the balance in satoshis (1 BTC = 100,000,000 satoshis)
             balance_in_satoshis = int(response.text)
-            balance_in_btc = balance_in_satoshis / 1e8  # Convert satoshis to BTC
-            return balance_in_btc
+            return balance_in_satoshis
+        else:
+            return f"Error: Unable to fetch balance, status code {response.status_code}"
+    except Exception as e:
+        return f"Exception occurred: {str(e)}"
+
+# Maximum number of addresses blockchain.info accepts in one balance request
+BALANCE_BATCH_SIZE = 100
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _balance_url(addresses):
+    return f"https://blockchain.info/balance?active={'|'.join(addresses)}"
+
+def _parse_balances(data):
+    # The API returns the balances in satoshis (1 BTC = 100,000,000 satoshis)
+    return {address: info['final_balance'] for address, info in data.items()}
+
+def get_bitcoin_balances(addresses):
+    """
+    Fetches the balances of many Bitcoin addresses, up to 100 per API request.
+
+    Parameters:
+    addresses (list): The Bitcoin addresses to check.
+
+    Returns:
+    dict: A mapping from each address to its balance in satoshis, or an error message.
+    """
+    balances = {}
+    try:
+        for chunk in _chunks(list(addresses), BALANCE_BATCH_SIZE):
+            response = SESSION.get(_balance_url(chunk), timeout=_TIMEOUT)
+
+            # Check if the request was successful
+            if response.status_code == 200:
+                balances.update(_parse_balances(orjson.loads(response.content)))
+            else:
+                return f"Error: Unable to fetch balances, status code {response.status_code}"
+        return balances
+    except Exception as e:
+        return f"Exception occurred: {str(e)}"
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); fall back to HTTP/1.1 without it
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Maximum number of requests in flight for the async helpers
+MAX_CONCURRENCY = 8
+
+@retry(
+    wait=wait_exponential(min=0.3, max=5),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(httpx.TransportError) | retry_if_result(lambda response: response.status_code in _RETRY_STATUSES),
+    # Once out of attempts, hand back the last response (or raise the last error)
+    retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+)
+async def _get_async(client, url):
+    return await client.get(url)
+
+async def get_bitcoin_balance_async(client, address):
+    """
+    Asynchronous variant of `get_bitcoin_balance` sharing an httpx client.
+
+    Parameters:
+    client (httpx.AsyncClient): The client used to issue the request.
+    address (str): The Bitcoin address to check.
+
+    Returns:
+    int: The balance of the Bitcoin address in satoshis (divide by 1e8 for BTC).
+    """
+    try:
+        url = f"https://blockchain.info/q/addressbalance/{address}"
+        response = await _get_async(client, url)
+        if response.status_code == 200:
+            # The API returns the balance in satoshis (1 BTC = 100,000,000 satoshis)
+            balance_in_satoshis = int(response.text)
+            return balance_in_satoshis
         else:
             return f"Error: Unable to fetch balance, status code {response.status_code}"
     except Exception as e:
         return f"Exception occurred: {str(e)}"
 
+async def get_bitcoin_balances_async(client, addresses):
+    """
+    Asynchronous variant of `get_bitcoin_balances` for a single batch of addresses.
+
+    Parameters:
+    client (httpx.AsyncClient): The client used to issue the request.
+    addresses (list): At most 100 Bitcoin addresses to check.
+
+    Returns:
+    dict: A mapping from each address to its balance in satoshis, or an error message.
+    """
+    try:
+        response = await _get_async(client, _balance_url(addresses))
+        if response.status_code == 200:
+            return _parse_balances(orjson.loads(response.content))
+        else:
+            return f"Error: Unable to fetch balances, status code {response.status_code}"
+    except Exception as e:
+        return f"Exception occurred: {str(e)}"
+
+async def batch_get_balances_async(addresses):
+    """
+    Coroutine behind `batch_get_balances`. Await it directly where an event loop is
+    already running, e.g. `await bc.batch_get_balances_async(addresses)` in Jupyter.
+
+    Parameters:
+    addresses (list): The Bitcoin addresses to check.
+
+    Returns:
+    dict: A mapping from each address to its balance in satoshis (or an error message).
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    limits = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
+    # HTTP/2 multiplexes the concurrent requests over a single connection
+    async with httpx.AsyncClient(http2=_HTTP2, limits=limits, timeout=10.0) as client:
+        async def bounded(chunk):
+            async with semaphore:
+                return await get_bitcoin_balances_async(client, chunk)
+
+        results = await asyncio.gather(*[bounded(chunk) for chunk in _chunks(list(addresses), BALANCE_BATCH_SIZE)])
+
+    balances = {}
+    for chunk, result in zip(_chunks(list(addresses), BALANCE_BATCH_SIZE), results):
+        if isinstance(result, dict):
+            balances.update(result)
+        else:
+            # Report the batch error for every address of the failed batch
+            balances.update(dict.fromkeys(chunk, result))
+    return balances
+
+def batch_get_balances(addresses):
+    """
+    Fetches the balances of many Bitcoin addresses, sending the batches of 100 concurrently.
+
+    Parameters:
+    addresses (list): The Bitcoin addresses to check.
+
+    Returns:
+    dict: A mapping from each address to its balance in satoshis (or an error message).
+
+    This starts its own event loop, so it can only be called from synchronous code.
+    Inside a running loop (e.g. a Jupyter notebook) use `batch_get_balances_async`.
+    """
+    return asyncio.run(batch_get_balances_async(addresses))
+
 def get_block_info(block_identifier):
     """
     Fetches detailed information of a Bitcoin block using Blockchain.com API.
@@ -42,11 +216,11 @@ def get_block_info(block_identifier):
     try:
         # Make an API request to Blockchain.com to get block details
         url = f"https://blockchain.info/rawblock/{block_identifier}"
-        response = requests.get(url)
+        response = SESSION.get(url, timeout=_TIMEOUT)
         
         # Check if the request was successful
         if response.status_code == 200:
-            block_info = response.json()  # Parse the JSON response
+            block_info = orjson.loads(response.content)  # Parse the JSON response
             return block_info
         else:
             return f"Error: Unable to fetch block info, status code {response.status_code}"
@@ -68,11 +242,11 @@ def get_last_transactions(address, limit=10):
     try:
         # Make an API request to Blockchain.com to get address transactions
         url = f"https://blockchain.info/rawaddr/{address}?limit={limit}"
-        response = requests.get(url)
+        response = SESSION.get(url, timeout=_TIMEOUT)
         
         # Check if the request was successful
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             transactions = data.get('txs', [])
             return transactions[:limit]  # Return the last `limit` transactions
         else:
@@ -91,23 +265,40 @@ def save_transactions_to_dataframe(transactions):
     Returns:
     DataFrame: A Pandas DataFrame containing the transaction details.
     """
-    transaction_data = []
-    
-    for tx in transactions:
-        # Extract relevant information from each transaction
-        tx_data = {
-            # "Hash": tx['hash'],
-            "Time (UTC)": datetime.utcfromtimestamp(tx['time']),
-            "Inputs": len(tx['inputs']),
-            "Outputs": len(tx['out']),
-            "Total BTC Transacted": sum(out['value'] for out in tx['out']) / 1e8
-        }
-        transaction_data.append(tx_data)
-    
-    # Create a DataFrame from the transaction data
-    df = pd.DataFrame(transaction_data)
+    n = len(transactions)
+
+    # Build each column as a typed array in one pass instead of one dict per transaction
+    times = np.fromiter((tx['time'] for tx in transactions), dtype='int64', count=n)
+    inputs = np.fromiter((len(tx['inputs']) for tx in transactions), dtype='int32', count=n)
+    outputs = np.fromiter((len(tx['out']) for tx in transactions), dtype='int32', count=n)
+
+    # Flatten every output value into one array and sum each transaction's slice in a single reduction.
+    # The trailing zero keeps every offset a valid index, and reduceat returns a single element
+    # instead of 0 for empty slices, so transactions without outputs are masked to 0.
+    offsets = np.concatenate(([0], np.cumsum(outputs, dtype='int64')))
+    values = np.fromiter((out['value'] for tx in transactions for out in tx['out']), dtype='int64', count=offsets[-1])
+    values = np.append(values, 0)
+    totals = np.where(outputs > 0, np.add.reduceat(values, offsets[:-1]), 0)
+
+    # Create a DataFrame from the transaction columns
+    df = pd.DataFrame({
+        "Time (UTC)": pd.to_datetime(times, unit='s', utc=True),
+        "Inputs": inputs,
+        "Outputs": outputs,
+        "Total Satoshi": totals,
+    })
     return df
 
+# Define the expected "nighttime inactivity" distribution (e.g., less activity from 12 AM to 6 AM)
+_NIGHTTIME_INACTIVITY = np.zeros(24)
+_NIGHTTIME_INACTIVITY[0:6] = 1 / 6  # Assuming inactivity from 12 AM to 6 AM
+
+# Define time zones from UTC-12 to UTC+12
+_TIME_ZONES = np.arange(-12, 13, 1)
+
+# Spectrum of the inactivity mask, used for the circular cross-correlation below
+_NIGHTTIME_SPECTRUM = np.fft.rfft(_NIGHTTIME_INACTIVITY)
+
 def calculate_time_zone_probability(transaction_freq):
     """
     Calculate the posterior probability distribution of the user's time zone
@@ -120,47 +311,34 @@ def calculate_time_zone_probability(transaction_freq):
     np.array: A normalized array of posterior probabilities for each time zone (UTC-12 to UTC+12).
     """
     
-    # Normalize the transaction frequency to get a probability distribution
-    transaction_prob = np.array(transaction_freq) / np.sum(transaction_freq)
-
-    # Define the expected "nighttime inactivity" distribution (e.g., less activity from 12 AM to 6 AM)
-    nighttime_inactivity = np.zeros(24)
-    nighttime_inactivity[0:6] = 1  # Assuming inactivity from 12 AM to 6 AM
-    nighttime_inactivity /= np.sum(nighttime_inactivity)
+    # The likelihood of time zone tz is the dot product of np.roll(transaction_freq, tz) with
+    # the assumed nighttime inactivity, i.e. their circular cross-correlation at lag tz, which
+    # a single 24-point FFT gives for every lag at once. The frequencies need no normalization
+    # of their own: the posterior normalization below absorbs the scale.
+    freq_spectrum = np.fft.rfft(np.asarray(transaction_freq, dtype=float))
+    correlation = np.fft.irfft(_NIGHTTIME_SPECTRUM * np.conj(freq_spectrum), n=24)
 
-    # Define time zones from UTC-12 to UTC+12
-    time_zones = np.arange(-12, 13, 1)  # from UTC-12 to UTC+12
-
-    # Initialize an array to store the likelihood for each time zone
-    likelihoods = []
-
-    # Compute the likelihood for each time zone
-    for tz in time_zones:
-        shifted_prob = np.roll(transaction_prob, tz)  # shift the distribution based on the time zone
-        likelihood = np.sum(shifted_prob * nighttime_inactivity)  # dot product with assumed nighttime inactivity
-        likelihoods.append(likelihood)
+    # Clip the FFT rounding noise so no likelihood goes negative, then round relative to the
+    # largest one so exactly tied time zones stay tied and np.argmax picks the westernmost
+    likelihoods = np.maximum(correlation[_TIME_ZONES % 24], 0)
+    likelihoods = np.round(likelihoods / likelihoods.max(), 12)
 
     # Convert likelihoods to posterior probabilities assuming uniform priors
-    posterior_probabilities = np.array(likelihoods) / np.sum(likelihoods)
-    
-    return time_zones, posterior_probabilities
+    posterior_probabilities = likelihoods / np.sum(likelihoods)
+
+    return _TIME_ZONES, posterior_probabilities
 
 def guess_time_zones(address):
     # Example usage
     transactions = get_last_transactions(address, limit=100)
-    # Save the transactions into a Pandas DataFrame
-    df_transactions = save_transactions_to_dataframe(transactions)
-
-    # Convert the timestamps to datetime objects
-    datetimes = df_transactions["Time (UTC)"]
 
-    # Extract the hour component from each datetime
-    hours = [dt.hour + dt.minute / 60 for dt in datetimes]
+    # Work on the raw Unix timestamps; no DataFrame or datetime objects are needed here
+    times = np.array([tx['time'] for tx in transactions], dtype='int64')
 
-    # Convert hours to a DataFrame
-    df_hours = pd.DataFrame(hours, columns=['Hour'])
+    # Extract the fractional UTC hour of each transaction
+    hours = (times % 86400) / 3600.0
 
-    transaction_freq, bin_edges = np.histogram(df_hours['Hour'], bins=24, range=(0, 24))
+    transaction_freq, bin_edges = np.histogram(hours, bins=24, range=(0, 24))
 
     time_zones, probabilities = calculate_time_zone_probability(transaction_freq)
 
@@ -1,6 +1,9 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+from io import StringIO
+from lxml import html
 import pandas as pd
+# Pages go through the cached, retrying session shared with blockchain.py
+from blockchain import SESSION as session
 # Base URL without the suffix
 base_url = 'https://bitinfocharts.com/top-100-richest-bitcoin-addresses'
 
@@ -10,76 +13,90 @@ num_pages = 1
 # Class prefix to target
 class_prefix = 'table table-striped'
 
-# List to hold all Bitcoin addresses and balances from all tables across all pages
-all_bitcoin_data = []
+# Columns extracted from each table
+columns = ['Address', 'Balance (satoshi)', 'Ins', 'Outs']
 
-# Loop through the pages
-for i in range(1, num_pages + 1):
+# Maximum number of pages downloaded at the same time
+max_concurrency = 20  # matches the shared session's connection pool size
 
-    print(f"Extracting data from Page {i}...")
+# (connect, read) timeouts in seconds
+timeout = (3, 10)
+
+
+def url_for(i):
     # Construct the URL for each page
     if i == 1:
-        url = f'{base_url}.html'
-    else:
-        url = f'{base_url}-{i}.html'
-    
-    # Send a GET request to the website
-    response = requests.get(url)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the HTML content using BeautifulSoup
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Find all tables with classes that start with the specified prefix
-        tables = soup.find_all('table', class_=lambda x: x and x.startswith(class_prefix))
-
-        # Loop through each table that matches the class prefix
-        for table_index, table in enumerate(tables, start=1):
-            # Extract all rows from the table
-            rows = table.find_all('tr')
-
-            # Loop through the rows and extract Bitcoin addresses and balances
-            for row in rows[1:]:  # Skip the header row
-                cols = row.find_all('td')
-                if len(cols) > 1:  # Ensure the row has the expected number of columns
-                    # Try to extract the full Bitcoin address
-                    address_tag = cols[1].find('a')
-                    address = address_tag['href'].split('/')[-1].strip()  # Extract from href if needed
-
-                    # Alternatively, get the full text from title attribute if available
-                    if 'title' in address_tag.attrs:
-                        address = address_tag['title'].strip()
-                    else:
-                        address = address_tag.text.strip()
-
-                    # Manually strip unwanted characters if they appear
-                    if address.endswith('..'):
-                        address = address[:-2]  # Remove the last two dots
-                    elif '..' in address:
-                        address = address.replace('..', '')  # Remove any instances of two dots in the middle
-
-                    balance_text = cols[2].text.strip()  # Assuming the third column contains the balance
-                    Ins = cols[6].text.strip()
-                    Outs = cols[9].text.strip()
-                    # Extract just the BTC amount from the balance_text
-                    btc_amount = float(balance_text.split(' ')[0].replace(',', ''))
-
-                    all_bitcoin_data.append((address, btc_amount, Ins, Outs))
-    else:
+        return f'{base_url}.html'
+    return f'{base_url}-{i}.html'
+
+
+async def fetch(semaphore, url):
+    # Send a GET request to the website in a worker thread, limiting the number of requests in flight
+    async with semaphore:
+        print(f"Extracting data from {url}...")
+        response = await asyncio.to_thread(session.get, url, timeout=timeout)
+        # Check if the request was successful
+        if response.status_code == 200:
+            return response.content
         print(f"Failed to retrieve the page: {url}. Status code: {response.status_code}")
+        return None
+
+
+def parse_page(content):
+    # Parse the raw HTML bytes directly with lxml
+    tree = html.fromstring(content)
+
+    # Find all tables with classes that start with the specified prefix
+    tables = tree.xpath(f'//table[starts-with(@class, "{class_prefix}")]')
+    if not tables:
+        return []
+
+    # Let pandas read every row of the matching tables in one pass, keeping the (text, href) of each cell.
+    # The first row of each table is its header.
+    tables_html = ''.join(html.tostring(table, encoding='unicode') for table in tables)
+    dfs = pd.read_html(StringIO(tables_html), header=0, extract_links='body')
+
+    # Keep the address, balance, Ins and Outs columns by position, as the headers differ between tables
+    dfs = [df.iloc[:, [1, 2, 6, 9]].set_axis(columns, axis=1) for df in dfs]
+
+    # Skip filler and short rows: only rows whose address cell holds a link describe an address
+    return [df[df['Address'].str[1].notna()] for df in dfs]
+
+
+async def main():
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # Download all pages concurrently so the network round trips overlap
+    pages_content = await asyncio.gather(*[fetch(semaphore, url_for(i)) for i in range(1, num_pages + 1)])
+
+    # Parsing is CPU bound, run it in worker threads to keep the event loop free
+    pages = await asyncio.gather(*[asyncio.to_thread(parse_page, content) for content in pages_content if content is not None])
+
+    # Flatten the per-page tables, keeping the page order
+    return [df for page in pages for df in page]
+
 
-# Now 'all_bitcoin_data' contains the full addresses without the '..' issue.
+# Raw (text, href) cells of all Bitcoin addresses and balances from all tables across all pages
+all_tables = asyncio.run(main())
 
-# Convert the list of tuples to a pandas DataFrame
-df = pd.DataFrame(all_bitcoin_data, columns=['Address', 'Balance (BTC)','Ins','Outs'])
+# Concatenate all tables into a single pandas DataFrame
+df = pd.concat(all_tables, ignore_index=True) if all_tables else pd.DataFrame([], columns=columns)
+# The link points to the full address, while its text may be shortened or followed by a wallet label
+df['Address'] = df['Address'].str[1].str.rsplit('/', n=1).str[-1]
+# Extract the BTC amount from the balance text and convert it exactly to integer satoshis
+btc_amount = df['Balance (satoshi)'].str[0].str.extract(r'([\d,]+)(?:\.(\d+))?')
+whole_btc = btc_amount[0].str.replace(',', '', regex=False).astype('int64')
+fraction_satoshi = btc_amount[1].fillna('').str.ljust(8, '0').str[:8].astype('int64')
+df['Balance (satoshi)'] = whole_btc * 100_000_000 + fraction_satoshi
+df['Ins'] = df['Ins'].str[0]
+df['Outs'] = df['Outs'].str[0]
 df['Outs'] = df['Outs'].replace("", 0)
 df['Outs'] = pd.to_numeric(df['Outs'], errors='coerce')
 df['Ins'] = pd.to_numeric(df['Ins'], errors='coerce')
 df['Transactions'] = df['Ins'] + df['Outs']
 df_filtered = df[df['Transactions'] >= 20]
-# Display the DataFrame
-print(df)
+# Display the DataFrame, showing the balances in BTC
+print(df.assign(**{'Balance (satoshi)': df['Balance (satoshi)'] / 1e8}).rename(columns={'Balance (satoshi)': 'Balance (BTC)'}))
 # Optionally, save the DataFrame to a CSV file
 df_filtered.to_csv('bitcoin_addresses.csv', index=False)
 